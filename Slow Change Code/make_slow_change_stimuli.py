@@ -17,8 +17,10 @@
 import os
 from PIL import Image
 import numpy
-import re
 import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from numba import njit, prange, set_num_threads
+import tifffile
 
 # ------ Global Variables ------
 morph_length_seconds = 16	# how long the morph will take place over
@@ -28,44 +30,55 @@ no_change_in_seconds = 2	# how many seconds of no changes at the beginning and e
 no_change_in_frames = no_change_in_seconds * steps_per_second_video	# how many frames are needed to achieve no_change_in_seconds of no changes at start and end of video; based on no_change_in_seconds and steps_per_second_video
 quick_change_time_section_proportion = 0.75	# each quick change occurs at a random moment within a designated section of the sequence. For instance, if there is only one quick change, then that section is the full sequence itself; if there are two quick changes, then the sections in which those changes occur are the first 0.5 and the second 0.5, respectively. For three it is the first 1/3, the second 1/3, and the third 1/3. The variable right here makes it so that the changes can only occur within a central proportion, defined here, of those sections. The reason is it avoids simultaneous changes (e.g. when change one is at the very last moment of the first section and change two is at the very first moment of the second section).
 quick_change_length_frames = steps_per_second_video	# how many frames the quick change will last (make sort of gradual instead of very abrupt) currently set to steps_per_second_video because we always want it to last 1s
-change_step = 1 / (quick_change_length_frames + 1)	# how many steps/frames the quick changes should last
+keep_frames = False	# the frames are sent straight to ffmpeg without being saved. for debugging or to preserve the selected frames that become the final video, set this to True to also save them in morph_path
 color = 'Yellow_Orange'	# name of the folder where the photoshopped component images to be used for these morphs are. This code is designed to be run for one color pair at a time and make sure to name the folder this color
 
 # ------ Paths ------
 jpg_path = '/Users/haleyfrey/Dropbox/MakeMovies/SlowChangeImages/' + color	# the location of the images that form the basis of the animations
-temp_path = '/Users/haleyfrey/Dropbox/MakeMovies/create_slow_change_scenes/temp/'	# location where we temporarily put frames that are then assembled to create the slow change sequences; will be created later if it does not already exist
-morph_path = '/Users/haleyfrey/Dropbox/MakeMovies/create_slow_change_scenes/morph_frames/'	# location where the set of frames to be converted to video will be saved
+morph_path = '/Users/haleyfrey/Dropbox/MakeMovies/create_slow_change_scenes/morph_frames/'	# location where the frames of each video are saved as .tif files if keep_frames is True
 output_path = '/Users/haleyfrey/Dropbox/MakeMovies/create_slow_change_scenes/final_videos/'	# location where the final videos and README will be saved
 ffmpeg_path = '/Applications/ffmpeg'	# location of ffmpeg; if ffmpeg has been added to PATH, ffmpeg_path can be equal to just 'ffmpeg'
 
-try:
-	os.mkdir(temp_path)			# create the temporary path...
-except:
-	pass						# ...and don't throw an error if it already exists
-
-try:
-	os.mkdir(morph_path)		# create the output path...
-except:
-	pass						# ...and don't throw an error if it already exists
-
-try:
-	os.mkdir(output_path)		# create the output path...
-except:
-	pass						# ...and don't throw an error if it already exists
-
-# ------ Main Body of Script ------
-""" 1. Read in all component image files for each Img (that will become a video). Determine slow change states, number of quick changes, and quick change states. """
-jpg_file_names = [element for element in os.listdir(jpg_path) if '.jpg' in element] # select all jpg images in jpg_path
-filename_roots = list(set([this_file_name.split('_')[0] for this_file_name in jpg_file_names]))	# among all jpg_files, list of all unique strings that come before the first '_', aka which image it is. E.g., "Img01"
-
-for filename_root in filename_roots:	# go over all those unique strings that can come before the fist '_' (loop through all images in folder)
+if keep_frames:
+	os.makedirs(morph_path, exist_ok=True)		# create the path for the saved frames, and don't throw an error if it already exists
+os.makedirs(output_path, exist_ok=True)		# create the output path, and don't throw an error if it already exists
+
+# ------ Functions ------
+@njit(['void(uint8[:, :, ::1], uint8[:, :, ::1], int64, int64, uint8[:, :, ::1])', 'void(uint8[:, :, :], uint8[:, :, :], int64, int64, uint8[:, :, :])'], parallel=True, fastmath=True)
+def blend_u8(image_a, image_b, num, den, out):
+	""" Write the weighted average (image_a * num + image_b * (den - num)) // den of two 8-bit images into out. Numba compiles this into a plain loop over the pixels, with the rows split across CPU cores, so the blend needs no float math and no temporary arrays. It is compiled only for the signatures listed above (whole images, and boxes cut out of them), with 64-bit integer weights, so the blend always stays in integer arithmetic: numba never builds a float version of it, even if it is handed float weights. """
+	num_b = den - num
+	for y in prange(image_a.shape[0]):
+		for x in range(image_a.shape[1]):
+			for c in range(image_a.shape[2]):
+				out[y, x, c] = (image_a[y, x, c] * num + image_b[y, x, c] * num_b) // den
+
+def slow_morph(image_pair, morph_step, out):
+	""" Write the morph at morph_step (out of number_of_morph_steps) between the two images of image_pair into out, and return out. This is a weighted average with the integer weights (number_of_morph_steps - morph_step) and morph_step, which matches the truncated float weighted average (exactly, where the float version could land just below a whole number). """
+	blend_u8(image_pair[0], image_pair[1], number_of_morph_steps - morph_step, number_of_morph_steps, out)
+	return out
+
+def difference_box(images_a, images_b):
+	""" Return the smallest box, as a (rows, columns) pair of slices, that holds every pixel at which an image in images_a differs from the matching image in images_b; or None if they are all identical. """
+	differs = numpy.zeros(images_a[0].shape[:2], dtype=bool)
+	for image_a, image_b in zip(images_a, images_b):
+		differs |= numpy.any(image_a != image_b, axis=2)
+	rows = numpy.flatnonzero(differs.any(axis=1))
+	if len(rows) == 0:
+		return None
+	columns = numpy.flatnonzero(differs.any(axis=0))
+	return slice(rows[0], rows[-1] + 1), slice(columns[0], columns[-1] + 1)
+
+def process_one(filename_root, jpg_file_names, seed_sequence):
+	""" Make the slow change video for one image (e.g. "Img01") out of its component images among jpg_file_names, and return the text describing it for the README. seed_sequence (a numpy.random.SeedSequence) seeds the random choices for this image. Each image is independent of the others, so the main body of the script runs this for several images at once, one per CPU core. """
 
 	print('working on file ' + filename_root)
+	rng = numpy.random.default_rng(seed_sequence)	# every random choice for this image comes from its own generator. the main process hands each image a different seed_sequence, so images processed at the same time (in copies of the same process) still get independent random choices
 
 	these_file_names = [one_file_name for one_file_name in jpg_file_names if one_file_name.split('_')[0] == filename_root]	# select all file names that have that string in that position
 
 	slow_change_options = [color.split('_')[0], color.split('_')[1]]	# the two options for the slow change; NOTE: make sure that the files are named accordingly with the color name occuring after the first "_"; because this code expects to be run for a single color combination at a time, the color variable can be used to obtain the slow change states
-	numpy.random.shuffle(slow_change_options)	# shuffling the slow_change_options randomizes which direction the morph occurs. to keep this standard (and matching the folder name), simply comment out this line
+	rng.shuffle(slow_change_options)	# shuffling the slow_change_options randomizes which direction the morph occurs. to keep this standard (and matching the folder name), simply comment out this line
 	
 	num_quick_changes = len(these_file_names[0].split('_')) - 2	# how many quick changes are there? the number of quick changes is determined by the options in the file name: after the Img# and slow color option, the quick change options are listed and separated by "_"
 	all_quick_change_options = []		# make a list of pairs of values, with each pair being the two values that a given quick-change property can take (e.g. Window and Nowin), and the length of the list being equal to the number of quick changes (so num_quick_changes); later this will be shuffled to randomize the order of the quick changes
@@ -77,127 +90,139 @@ for filename_root in filename_roots:	# go over all those unique strings that can
 
 		quick_changes_in_name_order += [[one_option.split('.')[0] for one_option in these_quick_change_options]]
 	
-	numpy.random.shuffle(all_quick_change_options)	# allows the changes to occur in a random order. for nonrandom order, uncomment this line. this will result in the changes occuring in the order they are presented in the file name
-
-	# Write details of each video to a README text file
-	# code adapted from https://thispointer.com/how-to-append-text-or-lines-to-a-file-in-python/
-	readme_filename = 'README.txt'
-	with open(os.path.join(output_path, readme_filename),"a+") as readme_file:
-		readme_file.seek(0)	# move read cursor to the start of file.
-		data = readme_file.read(100)	# if file is not empty then append '\n'
-		if len(data) > 0 :
-			readme_file.write("\n")
-
-		# Append text at the end of file
-		readme_file.write('This slow change video is of ' + filename_root + '.\n')
-		readme_file.write('The beginning color is ' + slow_change_options[0] + ' and the ending color is ' + slow_change_options[1] + '.\n')
-		readme_file.write('There are ' + str(num_quick_changes) + ' quick changes which occur as follows:\n')
-		for one_change in range(num_quick_changes):
-			readme_file.write(all_quick_change_options[one_change][0] + ' changes to ' + all_quick_change_options[one_change][1] + '.\n')
-
-	""" 2. Create a series of intermediate images that gradually step from the inital image to the final image, with just the color differing between images. """
-	file_names_first_slow_option = [this_file_name for this_file_name in these_file_names if this_file_name.split('_')[1] == slow_change_options[0]]	# select all file names that have the first color option for the slow change
-
-	for file_name_first_slow_option in file_names_first_slow_option:	# for each of those file names, grab the corresponding image with the other slow change option, and make a set of intermediate images (i.e. morphs between the two); For example, we will pair these images: Img01_Orange_yesWindow_noFlower.jpg and Img01_Yellow_yesWindow_noFlower.jpg and create a series of images gradually morphing between them
+	rng.shuffle(all_quick_change_options)	# allows the changes to occur in a random order. for nonrandom order, uncomment this line. this will result in the changes occuring in the order they are presented in the file name
 
-		image_data_first_slow_option = numpy.array(Image.open(os.path.join(jpg_path, file_name_first_slow_option)))	# import the image with this filename. At this point image_data_first_slow_option is some unusual object defined by the PIL module that the Image method belongs to (see imports above) and convert it to a numpy array: basically a matrix of RGB values
+	# Write details of each video to a README text file. the worker processes only put the text together; the main process then writes it to the README for all videos, so that several processes don't append to the same file at once
+	readme_text = 'This slow change video is of ' + filename_root + '.\n'
+	readme_text += 'The beginning color is ' + slow_change_options[0] + ' and the ending color is ' + slow_change_options[1] + '.\n'
+	readme_text += 'There are ' + str(num_quick_changes) + ' quick changes which occur as follows:\n'
+	for one_change in range(num_quick_changes):
+		readme_text += all_quick_change_options[one_change][0] + ' changes to ' + all_quick_change_options[one_change][1] + '.\n'
 
-		file_name_second_slow_option = re.sub(slow_change_options[0], slow_change_options[1], file_name_first_slow_option)	# the iamge pairs that we morph between consist of identitical quick change states and opposite slow change color states. here, we can get the name of the ending image by simply swapping the color portion of the image name
-		image_data_second_slow_option = numpy.array(Image.open(os.path.join(jpg_path, file_name_second_slow_option)))	# import the image and convert to numpy array
-
-		for morph_step in range(number_of_morph_steps + 1):	# there will be one more frames than there are morph steps; a matter of definition I suppose
-
-			image_data_morph = image_data_first_slow_option * (float(number_of_morph_steps - morph_step) / float(number_of_morph_steps)) + image_data_second_slow_option * (float(morph_step) / float(number_of_morph_steps))	# a weighted average of the two images' data gives us a morph. These are numpy arrays, which allow you to apply multiplication, addition, etc, to all elements all at once (which is what happens here). For python lists you'd have to do it per element.
-			image_data_morph = image_data_morph.astype(numpy.uint8)	# the weighted average operation has changed the data type in the array from 8-bit int to float or something so we need to change it back before turning the morph data into an image.
-			image_data_morph = Image.fromarray(image_data_morph, 'RGB')	# this turns it from a numpy array back into the PIL-related object type that Image.open() also gave us above. We can export that to an actual image file.
-			
-			output_filename = re.sub(slow_change_options[0], 'morph' + str(morph_step), file_name_first_slow_option)	# create the output filename for this morph
-			image_data_morph.save(os.path.join(temp_path,output_filename))	# and export the data to a file with that name
-
-	""" 3. Choose a "route" through the frames based on when you want the quick changes to happen. """
+	""" 2. Choose a "route" through the frames based on when you want the quick changes to happen. This is a dry run: no images are made yet, but it tells us exactly which versions of which frames the video will need. """
 	quick_change_frames = []		# make a list of all the moments at which the quick changes happen
+	quick_change_randoms = rng.random(num_quick_changes)	# one random number per quick change, drawn all at once, for where in its section the change happens
 	for quick_change_index in range(num_quick_changes):
-		new_change_moment_prop = ((float(quick_change_index) / float(num_quick_changes)) + (1. / float(num_quick_changes)) * float(1 - quick_change_time_section_proportion) / 2. + (1. / float(num_quick_changes)) * quick_change_time_section_proportion * numpy.random.rand())
+		new_change_moment_prop = ((float(quick_change_index) / float(num_quick_changes)) + (1. / float(num_quick_changes)) * float(1 - quick_change_time_section_proportion) / 2. + (1. / float(num_quick_changes)) * quick_change_time_section_proportion * quick_change_randoms[quick_change_index])
 		new_change_moment_frame = int(new_change_moment_prop*(number_of_morph_steps + 1))
 		quick_change_frames.append(new_change_moment_frame)
 
-	for curr_frame_index in range(number_of_morph_steps+1):		# walk through all the frames of our final sequence, and pick which version of that frame we want, based on when the quick changes happen; pick different quick change options (e.g. Window or Nowin) depending on whether the quick change in question has happened yet by the frame indicated by curr_frame_index
+	quick_change_windows = [(quick_change_frame - int(quick_change_length_frames / 2), quick_change_frame + int(quick_change_length_frames / 2)) for quick_change_frame in quick_change_frames]	# the range of frames [start, end) during which each quick change is happening; worked out once here instead of on every frame
+	initial_states = tuple(quick_change_option_pair[0] for quick_change_option_pair in quick_changes_in_name_order)	# every frame starts out with all of the initial states; later we will update the change states depending on whether they have changed yet
+	quick_change_positions = [quick_changes_in_name_order.index(quick_change_option_pair) for quick_change_option_pair in all_quick_change_options]	# where the state of each quick change (in the randomized order) sits among the states listed in name order
+	route = []	# for each frame of the route: the quick change states of the version we want (listed in name order, e.g. ('yesWindow', 'noFlower')), and, while a quick change is happening, the states it is changing to and the count that weighs the two (otherwise None)
+
+	for curr_frame_index in range(number_of_morph_steps+1):		# there will be one more frames than there are morph steps; a matter of definition I suppose. walk through all the frames of our final sequence, and pick which version of that frame we want, based on when the quick changes happen; pick different quick change options (e.g. Window or Nowin) depending on whether the quick change in question has happened yet by the frame indicated by curr_frame_index
 
-		# create a file_name for the current frame. it depends on frame index (morph) and number of changes. sets all to the first change option [0]. later we will update the change states depending on whether they have changed yet
-		this_filename = filename_root + '_morph' + str(curr_frame_index)
-		for one_change in range(len(quick_changes_in_name_order)):
-			this_filename += '_' + quick_changes_in_name_order[one_change][0]
-		this_filename += '.jpg'
+		this_states = list(initial_states)	# the quick change states of the current frame; together with the frame index (morph) they tell us which version of the frame to pick
+		quick_change = None
 
 		# for each of the quick changes, choose the appropriate version based on whether the change has occured
 		for change_idx, quick_change_option_pair in enumerate(all_quick_change_options):
-			# if the change has not happened yet, we do not need to do anything to the change component of this_filename because the name always starts with all of the initial states
+			# if the change has not happened yet, we do not need to do anything to the state of this change because the states always start with all of the initial states
+			change_start, change_end = quick_change_windows[change_idx]
+			position = quick_change_positions[change_idx]
 
-			# if the change has started and is currently happening, create average morphs and save them out. update this_filename to reflect the "avg" state
+			# if the change has started and is currently happening, we will need an average morph of the starting and ending state versions of this frame
 			# because each quick change is designed to last one second, we create steps_per_second_video number of frames which allows the quick change to take place over the span of one second when converted to video
-			if curr_frame_index >= quick_change_frames[change_idx] - int(quick_change_length_frames/2) and curr_frame_index < quick_change_frames[change_idx] + int(quick_change_length_frames / 2):	# while the change is happening
-
-				imgA = this_filename	# imgA is the starting state image
-				imgB = re.sub(quick_change_option_pair[0], quick_change_option_pair[1], this_filename)	# imgB is the ending state image
-				image_quick_changeA = numpy.array(Image.open(os.path.join(temp_path, imgA)))
-				image_quick_changeB = numpy.array(Image.open(os.path.join(temp_path, imgB)))
-				count = quick_change_frames[change_idx] + (quick_change_length_frames / 2) - curr_frame_index	# this will help us keep track of the intermediate morphs that are created as a quick change happens. to make the quick changes last one second, as set in our global variables, we need to morph between the two states of the change quick_change_length_frames times
-
-				# create weighted average of the two images; weight is determined by count
-				quick_change_morph = (image_quick_changeA) * (float(change_step) * count) + (image_quick_changeB) * (1 - (float(change_step) * count)) 
-				quick_change_morph = quick_change_morph.astype(numpy.uint8)	# change back to 8-bit
-				quick_change_morph = Image.fromarray(quick_change_morph, 'RGB')	# this turns it from a numpy array back into the PIL-related object type that Image.open() also gave us above. We can export that to an actual image file.
-				
-				output_filename=re.sub(quick_change_option_pair[0], 'avg', imgA)	# create the output filename for this averaged morph
-				quick_change_morph.save(os.path.join(temp_path, output_filename))	# save the new averaged morph
-				
-				this_filename = output_filename	# update this_filename to "choose" the avg version of this morph number
+			if change_start <= curr_frame_index < change_end:	# while the change is happening
+
+				imgA = tuple(this_states)	# imgA is the starting state image
+				this_states[position] = quick_change_option_pair[1]
+				imgB = tuple(this_states)	# imgB is the ending state image
+				count = 2 * (quick_change_frames[change_idx] - curr_frame_index) + quick_change_length_frames	# this will help us keep track of the intermediate morphs that are created as a quick change happens. to make the quick changes last one second, as set in our global variables, we need to morph between the two states of the change quick_change_length_frames times
+				quick_change = (imgB, count)
+				this_states = list(imgA)	# the averaged frame is made from the starting state version, with the ending state blended into it
 
 			# if the quick_change_frame for this change_idx has past, the change has occured. update the state of the current change to the changed state
-			elif curr_frame_index >= quick_change_frames[change_idx] + int(quick_change_length_frames / 2):
-				this_filename = re.sub(quick_change_option_pair[0], quick_change_option_pair[1], this_filename)
-
-		# now that we have selected the version of the image that we want (this_filename), convert it to .tif, rename it to just contain the morph step, and save it in the morph_path
-		image_data_this_frame = Image.open(os.path.join(temp_path, this_filename))	# get the image data into python again. The only reason to read it into python and then write it again, rather than simply moving and renaming the file we already have, is that we probably want to convert from .jpg to .tif, and this is one way of doing that. we want these images as tifs because they work better with ffmpeg for creating the morph; we also take this opportunity to adjust the dimensions of each image. image dimensions much each be divisible by 2 for ffmpeg to work so here, we adjust size of the image if needed
-		width, height = image_data_this_frame.size
-		width = width + 1 if width % 2 != 0 else width
-		height = height + 1 if height % 2 != 0 else height
-		image_data_this_frame = image_data_this_frame.resize((width, height))
-		output_filename = filename_root + '_morph' + str(curr_frame_index) + '.tif'
-		image_data_this_frame.save(os.path.join(morph_path, output_filename))
-
-	""" 4. Prepare the input for ffmpeg and use ffmpeg to generate the video based on the selected frames. """
-	# create a text file that lists in order the frames we want to add to the video. ffmpeg will read in the text file containing the list of filenames and string them together at the rate we defined above
-	with open(os.path.join(morph_path,'makeVideo.txt'), "a+") as text_file:
-		text_file.seek(0)	# move read cursor to the start of file.
-		data = text_file.read(100)	# if file is not empty then append '\n'
-		if len(data) > 0 :
-			text_file.write("\n")
-		
-		# Append text at the end of file
-		for frame_counter in range(no_change_in_frames):	# this adds no_change_in_frames number of lines to the text file so that ffmpeg will include no_change_in_seconds number of seconds of no changes at the start of the video using the initial frame
-			text_file.write('file \'' + morph_path + '/' + filename_root + '_morph0.tif\'\n')
-		text_file.write('file \'' + filename_root + '_morph%d.tif\'\n')	# adds each morph to the list in order according to the number after 'morph' in the file name
-		for frame_counter in range(no_change_in_frames):	# this ensures no_change_seconds number of seconds of no changes at the end of the video using the final frame
-			text_file.write('file \'' + morph_path + '/' + filename_root + '_morph' + str(number_of_morph_steps) + '.tif\'\n')
-	
-	image_size = numpy.array(image_data_this_frame).shape[:2]	# get image dimensions from most recent image. all dims are the same a this point after being resized, but we need to report the image size to ffmpeg
+			elif curr_frame_index >= change_end:
+				this_states[position] = quick_change_option_pair[1]
+
+		route.append((tuple(this_states), quick_change))
+
+	needed_states = set(this_states for this_states, quick_change in route) | set(quick_change[0] for this_states, quick_change in route if quick_change is not None)	# the quick change states of all versions of frames the route uses. only the image pairs with these states have to be read in; the others never appear in the video
+
+	""" 3. Read in the pairs of images to morph between, with just the color differing between the images of a pair, and make the frames of the route. The series of intermediate images that gradually step from the inital image to the final image is made one image at a time as the route needs it. """
+	slow_option_images = {}	# the (padded) pairs of images we morph between, by their quick change states, listed in name order, e.g. ('yesWindow', 'noFlower')
+	file_names_first_slow_option = [this_file_name for this_file_name in these_file_names if this_file_name.split('_')[1] == slow_change_options[0]]	# select all file names that have the first color option for the slow change
+
+	for file_name_first_slow_option in file_names_first_slow_option:	# for each of those file names, grab the corresponding image with the other slow change option, to later make intermediate images (i.e. morphs between the two); For example, we will pair these images: Img01_Orange_yesWindow_noFlower.jpg and Img01_Yellow_yesWindow_noFlower.jpg and create a series of images gradually morphing between them
+
+		quick_change_states = tuple(file_name_first_slow_option.split('.')[0].split('_')[2:])	# the quick change states of this pair, e.g. ('yesWindow', 'noFlower')
+		if quick_change_states not in needed_states:
+			continue
+
+		image_data_first_slow_option = numpy.asarray(Image.open(os.path.join(jpg_path, file_name_first_slow_option)).convert('RGB'))	# import the image with this filename. At this point image_data_first_slow_option is some unusual object defined by the PIL module that the Image method belongs to (see imports above) and convert it to a numpy array: basically a matrix of RGB values. numpy.asarray uses the image's array interface instead of making an extra copy, and converting to 'RGB' first guarantees we get RGB values even for palette or grayscale images
+
+		file_name_second_slow_option = file_name_first_slow_option.replace(slow_change_options[0], slow_change_options[1])	# the iamge pairs that we morph between consist of identitical quick change states and opposite slow change color states. here, we can get the name of the ending image by simply swapping the color portion of the image name
+		image_data_second_slow_option = numpy.asarray(Image.open(os.path.join(jpg_path, file_name_second_slow_option)).convert('RGB'))	# import the image and convert to numpy array
+
+		# image dimensions much each be divisible by 2 for ffmpeg to work so here, we repeat the last row and/or column of pixels if needed. doing this once to the two images we morph between gives every frame made from them the right size
+		even_padding = ((0, image_data_first_slow_option.shape[0] % 2), (0, image_data_first_slow_option.shape[1] % 2), (0, 0))
+		image_data_first_slow_option = numpy.pad(image_data_first_slow_option, even_padding, mode='edge')
+		image_data_second_slow_option = numpy.pad(image_data_second_slow_option, even_padding, mode='edge')
+
+		slow_option_images[quick_change_states] = (image_data_first_slow_option, image_data_second_slow_option)
+
+	quick_change_denominator = 2 * (quick_change_length_frames + 1)	# the quick change blend weights are count / (quick_change_length_frames + 1). we double both parts of that fraction so that count stays a whole number (even if quick_change_length_frames is odd) and the blend can be done with integer arithmetic
+	quick_change_boxes = {}	# for each pair of quick change states we blend between, the box around the pixels that differ between them (often just a small part of the image, e.g. the window); only that part needs blending
+	# a weighted average of the two images of a pair gives us a morph (see slow_morph). each morph is only needed for a single frame of the route, so rather than making and storing every morph of every pair up front, we make just the ones the route uses, when it gets to them. they are written into these buffers, which have the same size as every frame; each frame is sent to ffmpeg before the buffers are reused for the next one
+	morph_buffer = numpy.empty_like(image_data_first_slow_option)
+	quick_change_morph_buffer = numpy.empty_like(image_data_first_slow_option)	# the averaged frames go here
+
+	height, width = image_data_first_slow_option.shape[:2]	# all frames have this size, which was made divisible by 2 above
 	video_file_name = filename_root + '_' + color.replace('_','') + '.mp4'	# name the final video Img#_ColorCombo.mp4
 
+	# start ffmpeg before making the frames, so that each frame can be handed to it as soon as it is made, as raw RGB pixel values through a pipe. this way no image files have to be written and read back in
 	# code adapted from http://hamelot.io/visualization/using-ffmpeg-to-convert-a-set-of-images-into-a-video/
-	# these parameters can be changed as needed. more details about what these parameters are and how they affect the process can be found at the link
-	my_shell_command = ffmpeg_path + ' -r ' + str(steps_per_second_video) + ' -f concat -safe 0 -i ' + os.path.join(morph_path,'makeVideo.txt') + ' -vcodec libx264 -crf 25 -pix_fmt yuv420p ' + os.path.join(output_path,video_file_name) + ' -video_size ' + str(image_size[0]) + 'x' + str(image_size[1]) + ' -frame_drop_threshold -3.1 -codec:v prores -qscale 2'		#this is a terminal command that one could type into the terminal to get the ffmpeg application to convert the .tif images into a .mp4 movie. Passing this command to 'subprocess.Popen' as shown below allows you to run the terminal command from python
+	# these parameters can be changed as needed. more details about what these parameters are and how they affect the process can be found at the link. ffmpeg is told to only report errors (which are printed in step 4) because a pipe full of progress messages that nobody reads would stall it
+	ffmpeg_command = [ffmpeg_path, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', str(width) + 'x' + str(height), '-r', str(steps_per_second_video), '-i', 'pipe:0', '-c:v', 'libx264', '-crf', '25', '-pix_fmt', 'yuv420p', os.path.join(output_path, video_file_name)]
+	ffmpeg_process = subprocess.Popen(ffmpeg_command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+	for curr_frame_index, (this_states, quick_change) in enumerate(route):	# make each frame of the route
+
+		if quick_change is None:
+			image_data_this_frame = slow_morph(slow_option_images[this_states], curr_frame_index, morph_buffer)	# the intermediate image with the chosen quick change states
+		else:
+			# create weighted average of the starting (this_states) and ending state images; weight is determined by count. the two images can only differ where the images they were morphed from differ, so we make the starting state image right in the buffer for the averaged frame and only blend the ending state image into it within the box around those differences (blend_u8 works one pixel at a time, so it can write over one of its inputs)
+			end_states, count = quick_change
+			if (this_states, end_states) not in quick_change_boxes:
+				quick_change_boxes[(this_states, end_states)] = difference_box(slow_option_images[this_states], slow_option_images[end_states])
+			change_box = quick_change_boxes[(this_states, end_states)]
+			slow_morph(slow_option_images[this_states], curr_frame_index, quick_change_morph_buffer)
+			if change_box is not None:
+				slow_morph(slow_option_images[end_states], curr_frame_index, morph_buffer)
+				blend_u8(quick_change_morph_buffer[change_box], morph_buffer[change_box], count, quick_change_denominator, quick_change_morph_buffer[change_box])
+			image_data_this_frame = quick_change_morph_buffer
+
+		# send the frame to ffmpeg
+		for frame_counter in range(no_change_in_frames + 1 if curr_frame_index == 0 else 1):	# the initial frame is sent no_change_in_frames extra times, so that the video starts with no_change_in_seconds of no changes
+			ffmpeg_process.stdin.write(image_data_this_frame)	# the (contiguous, 8-bit) array's memory is written to the pipe as is
+		if keep_frames:
+			output_filename = filename_root + '_morph' + str(curr_frame_index) + '.tif'
+			tifffile.imwrite(os.path.join(morph_path, output_filename), image_data_this_frame, photometric='rgb', compression=None)	# tifffile writes the 8-bit RGB array straight to an uncompressed .tif
+
+	""" 4. Finish the video and report what ffmpeg said. """
+	for frame_counter in range(no_change_in_frames):	# this ensures no_change_seconds number of seconds of no changes at the end of the video using the final frame
+		ffmpeg_process.stdin.write(image_data_this_frame)
+	reply = ffmpeg_process.communicate()	# closing ffmpeg's input tells it the video is complete; then wait for it to finish
+	print('Attempt to turn frames into a movie returned the following reply: ' + str(reply[1]))	# this line will print what ffmpeg returns. It can be informative if ffmpeg doesn't work properly. simply comment this line out to avoid seeing the extra text.
+
+	return readme_text
 
-	reply = subprocess.Popen(my_shell_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-	print('Attempt to turn frames into a movie returned the following reply: ' + str(reply.communicate()[1]))	# this line will print what the shell command returns. It can be informative if the shell command doesn't work properly. simply comment this line out to avoid seeing the extra text.
-	
-	""" 5. Remove all temporary files from temp_path and morph_path and clear makeVideo.txt """
-	# remove all temporary files from temp_path morph_path and clear makeVideo.txt
-	for file_name in os.listdir(temp_path):
-		os.remove(os.path.join(temp_path, file_name))
-	for file_name in os.listdir(morph_path):	# for debugging or to preserve the selected frames that become the final video, comment out this loop
-		if '.tif' in file_name:
-			os.remove(os.path.join(morph_path, file_name))
-	file = open(os.path.join(morph_path,'makeVideo.txt'), "r+")
-	file.truncate(0)
-	file.close()
\ No newline at end of file
+# ------ Main Body of Script ------
+if __name__ == '__main__':	# the worker processes import this file to get process_one, so the main body must only run in the original process
+
+	""" 1. Read in all component image files for each Img (that will become a video). Determine slow change states, number of quick changes, and quick change states. """
+	jpg_file_names = [element for element in os.listdir(jpg_path) if '.jpg' in element] # select all jpg images in jpg_path
+	filename_roots = list(set([this_file_name.split('_')[0] for this_file_name in jpg_file_names]))	# among all jpg_files, list of all unique strings that come before the first '_', aka which image it is. E.g., "Img01"
+
+	number_of_workers = max(1, min(os.cpu_count(), len(filename_roots)))	# process as many images at the same time as there are CPU cores
+	with ProcessPoolExecutor(max_workers=number_of_workers, initializer=set_num_threads, initargs=(max(1, os.cpu_count() // number_of_workers),)) as executor:	# go over all those unique strings that can come before the fist '_' (all images in folder). blend_u8 also runs on several cores, so the cores are shared out between the worker processes
+		readme_texts = list(executor.map(process_one, filename_roots, [jpg_file_names] * len(filename_roots), numpy.random.SeedSequence().spawn(len(filename_roots))))	# SeedSequence().spawn gives each image its own independent seed
+
+	# Write details of each video to a README text file, appending to what earlier runs wrote there. everything is written at once, with an empty line between videos
+	readme_filename = 'README.txt'
+	with open(os.path.join(output_path, readme_filename), "a") as readme_file:
+		separator = "\n" if readme_file.tell() > 0 else ""	# a file opened for appending starts out positioned at its end, so this tells us whether it already holds text
+		readme_file.write(separator + '\n'.join(readme_texts))